@@ -1,19 +1,38 @@
 import os
+import hashlib
 import logging
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+import math
+import uuid
+from flask import Flask, render_template, request, redirect, url_for, flash, session, make_response
 from datetime import datetime, timedelta
+from assets import AssetPipeline, render_icon
 from data_store import DataStore
-from utils import calculate_recipe_quantities, consolidate_shopping_items
+from media import MediaStore, UploadRequest
+from utils import calculate_recipe_quantities, consolidate_shopping_items, shopping_list_version
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "fallback-secret-key")
+app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'uploads')
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+
+# Stream uploads to disk instead of buffering them in memory
+app.request_class = UploadRequest
 
 # Initialize data store
 data_store = DataStore()
 
+# Fingerprint and precompress static assets once at startup
+asset_pipeline = AssetPipeline(app.static_folder, os.path.join(app.root_path, '.asset-cache'))
+app.add_template_global(asset_pipeline.url, 'asset_url')
+app.add_template_global(render_icon, 'icon')
+
+# Recipe images, stored by content hash
+media_store = MediaStore(app.config['UPLOAD_FOLDER'])
+app.add_template_global(media_store.url, 'media_url')
+
 # Add custom Jinja2 filters
 @app.template_filter('add_days')
 def add_days_filter(date, days):
@@ -26,6 +45,46 @@ def nl2br_filter(value):
     """Convert newlines to <br> tags"""
     return value.replace('\n', '<br>\n')
 
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Serve fingerprinted static assets with long-lived cache headers"""
+    return asset_pipeline.send(filename)
+
+# Assets the offline shopping pages need, precached by the service worker
+OFFLINE_ASSETS = ['vendor/bootstrap/bootstrap.min.css', 'style.css', 'vendor/popper/popper.min.js',
+                  'vendor/bootstrap/bootstrap.min.js', 'app.js', 'sync.js']
+
+@app.route('/sw.js')
+def service_worker():
+    """Service worker for offline shopping, served from the root to control every page"""
+    precache_assets = [asset_pipeline.url(filename) for filename in OFFLINE_ASSETS]
+    # Cached pages reference the asset URLs, so they are versioned together
+    cache_version = hashlib.sha256('\n'.join(precache_assets).encode()).hexdigest()[:12]
+    response = make_response(render_template('sw.js', precache_assets=precache_assets,
+                                             cache_version=cache_version))
+    response.mimetype = 'application/javascript'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.teardown_request
+def discard_uploads(error):
+    """Delete temporary upload files, including those of an aborted multipart parse"""
+    request.discard_uploads()
+
+@app.route('/media/<path:filename>')
+def media(filename):
+    """Serve uploaded recipe images and their thumbnails"""
+    return media_store.send(filename)
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    """Reject uploads above MAX_CONTENT_LENGTH"""
+    # Only form submissions come from a page that can show the message
+    if request.mimetype not in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        return error
+    flash('Die Datei ist zu groß (maximal 16 MB)', 'error')
+    return redirect(request.referrer or url_for('recipes'))
+
 @app.route('/')
 def index():
     """Dashboard showing overview of recent activity"""
@@ -166,15 +225,29 @@ def save_recipe():
                 'notes': notes
             })
     
+    # Keep the current image unless a new one is uploaded or it is removed
+    existing_recipe = data_store.recipes.get(recipe_id) if recipe_id else None
+    image = existing_recipe.get('image') if existing_recipe else None
+    if request.form.get('remove_image'):
+        image = None
+    
+    upload = request.files.get('image')
+    if upload and upload.filename:
+        uploaded_image = media_store.save_upload(upload)
+        if uploaded_image:
+            image = uploaded_image
+        else:
+            flash('Bild konnte nicht gelesen werden (erlaubt: JPEG, PNG, GIF, WebP)', 'error')
+    
     if recipe_id:
         # Update existing recipe
         data_store.update_recipe(recipe_id, name, description, instructions, 
-                               prep_time, cook_time, servings, ingredients)
+                               prep_time, cook_time, servings, ingredients, image)
         flash(f'Rezept "{name}" wurde aktualisiert', 'success')
     else:
         # Create new recipe
         recipe_id = data_store.add_recipe(name, description, instructions, 
-                                        prep_time, cook_time, servings, ingredients)
+                                        prep_time, cook_time, servings, ingredients, image)
         flash(f'Rezept "{name}" wurde erstellt', 'success')
     
     return redirect(url_for('recipe_detail', recipe_id=recipe_id))
@@ -289,40 +362,15 @@ def shopping_list(plan_id):
         flash('Wochenplan nicht gefunden', 'error')
         return redirect(url_for('meal_plans'))
     
-    # Generate shopping list
-    shopping_items = []
+    consolidated_items = build_plan_shopping_list(meal_plan)
     
-    for planned_meal in meal_plan['planned_meals']:
-        recipe = data_store.recipes.get(planned_meal['recipe_id'])
-        if not recipe:
-            continue
-        
-        # Calculate quantities for this meal's servings
-        for ingredient in recipe['ingredients']:
-            item = data_store.items.get(ingredient['item_id'])
-            if not item:
-                continue
-            
-            # Scale quantity based on servings
-            scaled_quantity = calculate_recipe_quantities(
-                ingredient['quantity'], 
-                recipe['servings'], 
-                planned_meal['servings']
-            )
-            
-            shopping_items.append({
-                'item_id': ingredient['item_id'],
-                'item_name': item['name'],
-                'quantity': scaled_quantity,
-                'unit': ingredient['unit'],
-                'category': item['category'],
-                'recipe_name': recipe['name'],
-                'meal_date': planned_meal['date'].strftime('%d.%m.%Y'),
-                'meal_type': planned_meal['meal_type']
-            })
-    
-    # Consolidate items
-    consolidated_items = consolidate_shopping_items(shopping_items)
+    # Attach the synced checked state, keyed like the consolidation
+    checked_items = meal_plan.get('checked_items', {})
+    for item in consolidated_items:
+        item['key'] = f"{item['item_id']}_{item['unit']}"
+        state = checked_items.get(item['key'], {'checked': False, 'seq': 0})
+        item['checked'] = state['checked']
+        item['seq'] = state['seq']
     
     # Group by category
     categories = {}
@@ -335,7 +383,35 @@ def shopping_list(plan_id):
     return render_template('shopping_list.html', 
                          meal_plan=meal_plan,
                          categories=categories,
-                         total_items=len(consolidated_items))
+                         total_items=len(consolidated_items),
+                         list_version=shopping_list_version(consolidated_items),
+                         sync_id=data_store.sync_id,
+                         sync_seq=data_store.sequence)
+
+@app.route('/meal-plans/<plan_id>/shopping-list/sync', methods=['POST'])
+def sync_plan_shopping_list(plan_id):
+    """Apply queued offline toggles and return checked states changed since the client's sequence"""
+    if plan_id not in data_store.meal_plans:
+        return {'success': False}, 404
+    
+    payload = parse_sync_payload()
+    if payload is None:
+        return {'success': False}, 400
+    since, ops, client_id = payload
+    
+    for op in ops:
+        if op.get('op') == 'toggle' and isinstance(op.get('key'), str):
+            data_store.set_plan_item_checked(plan_id, op['key'], bool(op.get('checked')),
+                                             parse_int(op.get('base_seq')), client_id)
+    
+    return {
+        'success': True,
+        'sync_id': data_store.sync_id,
+        'seq': data_store.sequence,
+        # Pages may come from the offline cache, a changed version tells them to reload
+        'version': shopping_list_version(build_plan_shopping_list(data_store.meal_plans[plan_id])),
+        'items': data_store.plan_checklist_changes(plan_id, since)
+    }
 
 @app.route('/meal-plans/<plan_id>/delete', methods=['POST'])
 def delete_meal_plan(plan_id):
@@ -372,7 +448,9 @@ def general_shopping_list():
     return render_template('general_shopping_list.html',
                          categories=categories,
                          total_items=len(shopping_items_with_details),
-                         items=data_store.items.values())
+                         items=data_store.items.values(),
+                         sync_id=data_store.sync_id,
+                         sync_seq=data_store.sequence)
 
 @app.route('/shopping-list/add', methods=['POST'])
 def add_shopping_item():
@@ -384,6 +462,8 @@ def add_shopping_item():
     
     if not all([item_id, quantity, unit]):
         flash('Artikel, Menge und Einheit sind erforderlich', 'error')
+    elif not valid_quantity(quantity):
+        flash('Ungültige Menge', 'error')
     else:
         data_store.add_shopping_item(item_id, quantity, unit, notes)
         flash('Artikel zur Einkaufsliste hinzugefügt', 'success')
@@ -414,5 +494,143 @@ def clear_checked_items():
     flash(f'{count} erledigte Artikel entfernt', 'success')
     return redirect(url_for('general_shopping_list'))
 
+@app.route('/shopping-list/sync', methods=['POST'])
+def sync_shopping_list():
+    """Apply queued offline changes and return shopping items changed since the client's sequence"""
+    payload = parse_sync_payload()
+    if payload is None:
+        return {'success': False}, 400
+    since, ops, client_id = payload
+    
+    # Additions the server did not accept, the client has to drop its optimistic rows
+    rejected = []
+    for op in ops:
+        kind = op.get('op')
+        shopping_item_id = parse_uuid(op.get('id'))
+        if shopping_item_id is None:
+            continue
+        
+        if kind == 'toggle':
+            data_store.set_shopping_item_checked(shopping_item_id, bool(op.get('checked')),
+                                                 parse_int(op.get('base_seq')), client_id)
+        elif kind == 'remove':
+            data_store.remove_shopping_item(shopping_item_id)
+        elif kind == 'add':
+            item_id = op.get('item_id')
+            quantity = op.get('quantity')
+            unit = str(op.get('unit') or '').strip()
+            if isinstance(item_id, str) and item_id in data_store.items and valid_quantity(quantity) and unit:
+                data_store.add_shopping_item(item_id, float(quantity), unit,
+                                             str(op.get('notes') or '').strip(), shopping_item_id, client_id)
+            if shopping_item_id not in data_store.shopping_list:
+                rejected.append(shopping_item_id)
+    
+    changed, removed, reset = data_store.shopping_list_changes(since)
+    removed.extend(item_id for item_id in rejected if item_id not in removed)
+    items = []
+    for shopping_item in changed:
+        item = data_store.items.get(shopping_item['item_id'])
+        if not item:
+            # Items whose food item was deleted are hidden from the list
+            removed.append(shopping_item['id'])
+            continue
+        items.append({
+            'id': shopping_item['id'],
+            'item_name': item['name'],
+            'item_category': item['category'],
+            'quantity': shopping_item['quantity'],
+            'unit': shopping_item['unit'],
+            'notes': shopping_item['notes'],
+            'checked': shopping_item['checked'],
+            'seq': shopping_item['seq']
+        })
+    
+    return {
+        'success': True,
+        'sync_id': data_store.sync_id,
+        'seq': data_store.sequence,
+        'reset': reset,
+        'items': items,
+        'removed': removed
+    }
+
+def build_plan_shopping_list(meal_plan):
+    """Consolidated shopping items for all planned meals of a meal plan"""
+    shopping_items = []
+    
+    for planned_meal in meal_plan['planned_meals']:
+        recipe = data_store.recipes.get(planned_meal['recipe_id'])
+        if not recipe:
+            continue
+        
+        # Calculate quantities for this meal's servings
+        for ingredient in recipe['ingredients']:
+            item = data_store.items.get(ingredient['item_id'])
+            if not item:
+                continue
+            
+            # Scale quantity based on servings
+            scaled_quantity = calculate_recipe_quantities(
+                ingredient['quantity'], 
+                recipe['servings'], 
+                planned_meal['servings']
+            )
+            
+            shopping_items.append({
+                'item_id': ingredient['item_id'],
+                'item_name': item['name'],
+                'quantity': scaled_quantity,
+                'unit': ingredient['unit'],
+                'category': item['category'],
+                'recipe_name': recipe['name'],
+                'meal_date': planned_meal['date'].strftime('%d.%m.%Y'),
+                'meal_type': planned_meal['meal_type']
+            })
+    
+    return consolidate_shopping_items(shopping_items)
+
+def parse_sync_payload():
+    """Read (since, ops, client_id) from a sync request, None if malformed
+    
+    A client that last synced against another data store instance (sync_id differs)
+    gets every change again by starting from sequence 0.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('ops', []), list):
+        return None
+    since = parse_int(payload.get('since'))
+    if payload.get('sync_id') != data_store.sync_id:
+        since = 0
+    ops = [op for op in payload.get('ops', []) if isinstance(op, dict)]
+    return since, ops, parse_uuid(payload.get('client_id'))
+
+def parse_uuid(value):
+    """Canonical form of a client-supplied UUID string, None if invalid"""
+    if not isinstance(value, str) or len(value) != 36:
+        return None
+    try:
+        return str(uuid.UUID(value))
+    except ValueError:
+        return None
+
+def valid_quantity(value) -> bool:
+    """Whether a client-supplied quantity is a positive finite number"""
+    # bool is a subclass of int, but true is no quantity
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        value = float(value)
+    except OverflowError:
+        return False
+    # inf or nan would end up as invalid JSON in every later sync response
+    return math.isfinite(value) and value > 0
+
+def parse_int(value) -> int:
+    """Parse a non-negative integer from JSON input, 0 if invalid"""
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
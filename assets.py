@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from contextlib import contextmanager
+from typing import Dict
+
+import brotli
+from flask import abort, current_app, request, send_file, url_for
+from markupsafe import Markup, escape
+
+# Fingerprinted URLs never change content, so browsers may cache them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.webmanifest'}
+
+# Compressing tiny files costs more in headers than it saves
+MIN_COMPRESS_SIZE = 512
+
+
+class AssetPipeline:
+    """Fingerprints static files by content hash and serves precompressed variants"""
+
+    def __init__(self, static_folder: str, cache_folder: str):
+        self.static_folder = static_folder
+        self.cache_folder = cache_folder
+        # logical name ('style.css') -> fingerprinted name ('style.1a2b3c4d5e6f.css')
+        self.manifest: Dict[str, str] = {}
+        # fingerprinted name -> asset details
+        self.files: Dict[str, dict] = {}
+
+        self.build()
+
+    def build(self):
+        """Hash and precompress every file below the static folder"""
+        for root, _dirs, filenames in os.walk(self.static_folder):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                logical = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                self._add(logical, path)
+
+    def _add(self, logical: str, path: str) -> str:
+        """Register a single file and generate its compressed variants"""
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        base, ext = os.path.splitext(logical)
+        fingerprinted = f'{base}.{digest}{ext}'
+
+        self.manifest[logical] = fingerprinted
+        self.files[fingerprinted] = {
+            'path': path,
+            'digest': digest,
+            'mtime': os.path.getmtime(path),
+            'mimetype': mimetypes.guess_type(logical)[0] or 'application/octet-stream',
+            'variants': self._compress(fingerprinted, data, ext)
+        }
+        return fingerprinted
+
+    def _compress(self, fingerprinted: str, data: bytes, ext: str) -> Dict[str, str]:
+        """Write gzip/brotli variants to the cache folder, keyed by fingerprint"""
+        variants = {}
+        if ext not in COMPRESSIBLE_EXTENSIONS or len(data) < MIN_COMPRESS_SIZE:
+            return variants
+
+        encoders = [
+            ('br', '.br', lambda raw: brotli.compress(raw, quality=11)),
+            ('gzip', '.gz', lambda raw: gzip.compress(raw, 9, mtime=0)),
+        ]
+
+        for encoding, suffix, encode in encoders:
+            target = os.path.join(self.cache_folder, fingerprinted + suffix)
+            if not os.path.exists(target):
+                compressed = encode(data)
+                if len(compressed) >= len(data):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with atomic_path(target) as tmp_path, open(tmp_path, 'wb') as f:
+                    f.write(compressed)
+            variants[encoding] = target
+        return variants
+
+    def _refresh(self, logical: str):
+        """Re-fingerprint a file that changed on disk (debug mode only)"""
+        path = os.path.join(self.static_folder, logical)
+        fingerprinted = self.manifest.get(logical)
+        if fingerprinted is None:
+            if os.path.isfile(path):
+                self._add(logical, path)
+        elif not os.path.isfile(path):
+            del self.manifest[logical]
+            del self.files[fingerprinted]
+        elif os.path.getmtime(path) != self.files[fingerprinted]['mtime']:
+            # The old URL promised immutable content, it must not serve the new bytes
+            del self.files[fingerprinted]
+            self._add(logical, path)
+
+    def url(self, filename: str) -> str:
+        """URL of the fingerprinted asset for a path relative to the static folder"""
+        if current_app.debug:
+            self._refresh(filename)
+        fingerprinted = self.manifest.get(filename)
+        if fingerprinted is None:
+            return url_for('static', filename=filename)
+        return url_for('asset', filename=fingerprinted)
+
+    def send(self, fingerprinted: str):
+        """Serve an asset, preferring the smallest encoding the client accepts"""
+        asset = self.files.get(fingerprinted)
+        if asset is None:
+            abort(404)
+
+        path, encoding = asset['path'], None
+        for candidate in ('br', 'gzip'):
+            if candidate in asset['variants'] and request.accept_encodings[candidate] > 0:
+                path, encoding = asset['variants'][candidate], candidate
+                break
+
+        response = send_file(path,
+                             mimetype=asset['mimetype'],
+                             etag=f"{asset['digest']}-{encoding or 'identity'}",
+                             conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+@contextmanager
+def atomic_path(target: str):
+    """Temporary path next to target, moved into place once it is completely written"""
+    # Concurrent workers never see a partial file
+    tmp_path = f'{target}.{os.getpid()}.tmp'
+    try:
+        yield tmp_path
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def render_icon(name: str, class_: str = '', **attrs) -> Markup:
+    """Render a Feather icon referencing the inline sprite in base.html"""
+    classes = ' '.join(filter(None, ['feather', f'feather-{name}', class_]))
+    extra = ''.join(f' {key}="{escape(value)}"' for key, value in attrs.items())
+    return Markup(
+        f'<svg class="{escape(classes)}" width="24" height="24" '
+        f'fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" '
+        f'stroke-linejoin="round" aria-hidden="true"{extra}>'
+        f'<use href="#icon-{escape(name)}"></use></svg>'
+    )
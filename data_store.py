@@ -1,6 +1,9 @@
 import uuid
-from datetime import datetime, date
-from typing import Dict, List, Optional
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# How long removed shopping items are remembered for delta sync
+TOMBSTONE_RETENTION = timedelta(days=7)
 
 class DataStore:
     """In-memory data store for the meal planning application"""
@@ -11,6 +14,15 @@ class DataStore:
         self.meal_plans: Dict[str, dict] = {}
         self.shopping_list: Dict[str, dict] = {}
         
+        # Change counter for offline sync, every shopping list change gets the next value.
+        # sync_id changes on restart so clients notice that old sequence numbers are void.
+        self.sync_id = str(uuid.uuid4())
+        self.sequence = 0
+        # Removed shopping item id -> (sequence, time) of the removal, oldest first
+        self.removed_shopping_items: Dict[str, Tuple[int, datetime]] = {}
+        # Highest sequence of a forgotten removal, clients behind it need a full reset
+        self.tombstone_floor = 0
+        
         # Initialize with some basic food categories and items
         self._initialize_sample_data()
     
@@ -63,7 +75,7 @@ class DataStore:
     
     def add_recipe(self, name: str, description: str, instructions: str,
                    prep_time: int, cook_time: int, servings: int, 
-                   ingredients: List[dict]) -> str:
+                   ingredients: List[dict], image: Optional[str] = None) -> str:
         """Add a new recipe"""
         recipe_id = str(uuid.uuid4())
         self.recipes[recipe_id] = {
@@ -75,13 +87,15 @@ class DataStore:
             'cook_time': cook_time,
             'servings': servings,
             'ingredients': ingredients,
+            'image': image,
             'created_at': datetime.now()
         }
         return recipe_id
     
     def update_recipe(self, recipe_id: str, name: str, description: str, 
                      instructions: str, prep_time: int, cook_time: int,
-                     servings: int, ingredients: List[dict]) -> bool:
+                     servings: int, ingredients: List[dict],
+                     image: Optional[str] = None) -> bool:
         """Update an existing recipe"""
         if recipe_id in self.recipes:
             self.recipes[recipe_id].update({
@@ -92,6 +106,7 @@ class DataStore:
                 'cook_time': cook_time,
                 'servings': servings,
                 'ingredients': ingredients,
+                'image': image,
                 'updated_at': datetime.now()
             })
             return True
@@ -111,6 +126,8 @@ class DataStore:
             'id': plan_id,
             'week_start_date': week_start_date,
             'planned_meals': [],
+            # Shopping list item key -> {'checked', 'seq', 'changed_by'}
+            'checked_items': {},
             'created_at': datetime.now()
         }
         return plan_id
@@ -148,9 +165,18 @@ class DataStore:
             return True
         return False
     
-    def add_shopping_item(self, item_id: str, quantity: float, unit: str, notes: str = '') -> str:
+    def _next_sequence(self) -> int:
+        """Advance the sync change counter"""
+        self.sequence += 1
+        return self.sequence
+    
+    def add_shopping_item(self, item_id: str, quantity: float, unit: str, notes: str = '',
+                          shopping_item_id: Optional[str] = None, client_id: Optional[str] = None) -> str:
         """Add item to general shopping list"""
-        shopping_item_id = str(uuid.uuid4())
+        # Offline clients choose their own id so replayed additions are not duplicated
+        shopping_item_id = shopping_item_id or str(uuid.uuid4())
+        if shopping_item_id in self.shopping_list or shopping_item_id in self.removed_shopping_items:
+            return shopping_item_id
         self.shopping_list[shopping_item_id] = {
             'id': shopping_item_id,
             'item_id': item_id,
@@ -158,6 +184,8 @@ class DataStore:
             'unit': unit,
             'notes': notes,
             'checked': False,
+            'seq': self._next_sequence(),
+            'changed_by': client_id,
             'created_at': datetime.now()
         }
         return shopping_item_id
@@ -166,19 +194,93 @@ class DataStore:
         """Remove item from general shopping list"""
         if shopping_item_id in self.shopping_list:
             del self.shopping_list[shopping_item_id]
+            self.removed_shopping_items[shopping_item_id] = (self._next_sequence(), datetime.now())
+            self._prune_tombstones()
             return True
         return False
     
     def toggle_shopping_item(self, shopping_item_id: str) -> bool:
         """Toggle checked status of shopping item"""
         if shopping_item_id in self.shopping_list:
-            self.shopping_list[shopping_item_id]['checked'] = not self.shopping_list[shopping_item_id]['checked']
+            shopping_item = self.shopping_list[shopping_item_id]
+            shopping_item['checked'] = not shopping_item['checked']
+            shopping_item['seq'] = self._next_sequence()
+            shopping_item['changed_by'] = None
             return True
         return False
     
+    def set_shopping_item_checked(self, shopping_item_id: str, checked: bool, base_seq: int,
+                                  client_id: Optional[str] = None) -> bool:
+        """Apply a checked state recorded by a client that last saw the item at base_seq"""
+        if shopping_item_id not in self.shopping_list:
+            return False
+        shopping_item = self.shopping_list[shopping_item_id]
+        resolved = resolve_checked(shopping_item, checked, base_seq, client_id)
+        if resolved != shopping_item['checked']:
+            shopping_item['checked'] = resolved
+            shopping_item['seq'] = self._next_sequence()
+            shopping_item['changed_by'] = client_id
+        return True
+    
     def clear_checked_shopping_items(self) -> int:
         """Remove all checked items from shopping list"""
         to_remove = [item_id for item_id, item in self.shopping_list.items() if item['checked']]
         for item_id in to_remove:
-            del self.shopping_list[item_id]
+            self.remove_shopping_item(item_id)
         return len(to_remove)
+    
+    def _prune_tombstones(self):
+        """Forget removals older than TOMBSTONE_RETENTION"""
+        cutoff = datetime.now() - TOMBSTONE_RETENTION
+        while self.removed_shopping_items:
+            shopping_item_id, (seq, removed_at) = next(iter(self.removed_shopping_items.items()))
+            if removed_at >= cutoff:
+                break
+            del self.removed_shopping_items[shopping_item_id]
+            self.tombstone_floor = seq
+    
+    def shopping_list_changes(self, since: int) -> Tuple[List[dict], List[str], bool]:
+        """Shopping items changed and ids removed after sequence number since
+        
+        Clients starting from scratch, or behind the oldest remembered removal, get
+        the whole list as a reset instead of every removal.
+        """
+        self._prune_tombstones()
+        if since == 0 or since < self.tombstone_floor:
+            return list(self.shopping_list.values()), [], True
+        changed = [item for item in self.shopping_list.values() if item['seq'] > since]
+        removed = [item_id for item_id, (seq, _removed_at) in self.removed_shopping_items.items() if seq > since]
+        return changed, removed, False
+    
+    def set_plan_item_checked(self, plan_id: str, item_key: str, checked: bool, base_seq: int,
+                              client_id: Optional[str] = None) -> bool:
+        """Apply a checked state for an item of a meal plan's shopping list"""
+        if plan_id not in self.meal_plans:
+            return False
+        checked_items = self.meal_plans[plan_id].setdefault('checked_items', {})
+        current = checked_items.get(item_key, {'checked': False, 'seq': 0, 'changed_by': None})
+        resolved = resolve_checked(current, checked, base_seq, client_id)
+        if resolved != current['checked']:
+            checked_items[item_key] = {'checked': resolved, 'seq': self._next_sequence(), 'changed_by': client_id}
+        return True
+    
+    def plan_checklist_changes(self, plan_id: str, since: int) -> Dict[str, dict]:
+        """Checked states of a meal plan's shopping list changed after since"""
+        checked_items = self.meal_plans[plan_id].get('checked_items', {})
+        return {key: {'checked': state['checked'], 'seq': state['seq']}
+                for key, state in checked_items.items() if state['seq'] > since}
+
+
+def resolve_checked(current: dict, checked: bool, base_seq: int, client_id: Optional[str] = None) -> bool:
+    """Resolve a client's checked state against the server's current one
+    
+    The client wins if it saw the current version, or if the current version is
+    its own earlier change (consecutive toggles queued offline share one base_seq).
+    If someone else changed the item in the meantime, checked wins, so replaying
+    offline changes in any order gives the same result.
+    """
+    if current['seq'] <= base_seq:
+        return checked
+    if client_id is not None and current.get('changed_by') == client_id:
+        return checked
+    return current['checked'] or checked
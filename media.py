@@ -0,0 +1,252 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Set
+
+from flask import Request, abort, current_app, send_file, url_for
+from PIL import Image, ImageOps
+
+from assets import IMMUTABLE_CACHE_CONTROL, atomic_path
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of the image formats we accept -> file extension
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+IMAGE_EXTENSIONS = ('jpg', 'png', 'gif', 'webp')
+
+# Pillow format name -> file extension of the formats we accept
+PILLOW_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+# Temporary upload files older than this are leftovers of crashed workers (seconds)
+STALE_UPLOAD_AGE = 3600
+
+# Uploads above this many pixels are rejected instead of rendered (about 40 megapixels)
+MAX_IMAGE_PIXELS = 40_000_000
+
+# Size name -> (max width, max height, crop to fill)
+THUMBNAIL_SIZES = {
+    'list': (480, 320, True),
+    'detail': (800, 800, False),
+    'retina': (1600, 1600, False),
+}
+
+MEDIA_FILENAME = re.compile(r'^(?P<digest>[0-9a-f]{64})(?:-(?P<size>[a-z]+))?\.(?P<ext>jpg|png|gif|webp)$')
+
+
+def detect_image_type(header: bytes) -> Optional[str]:
+    """File extension for the image format of a file header, None if unsupported"""
+    for signature, ext in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return ext
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def verify_image(path: str, ext: str) -> bool:
+    """Check that a file decodes as an image of the format its header claims"""
+    try:
+        with Image.open(path) as image:
+            if PILLOW_FORMATS.get(image.format) != ext:
+                return False
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                return False
+            image.verify()
+        return True
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return False
+
+
+class HashingFile:
+    """Temporary file on disk that hashes its content while it is written"""
+
+    def __init__(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        fd, self.name = tempfile.mkstemp(dir=folder, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def close(self):
+        """Close the file and drop it unless it was moved into the store"""
+        self._file.close()
+        try:
+            os.unlink(self.name)
+        except FileNotFoundError:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Request that streams uploaded files straight to disk instead of memory"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Temporary files created while parsing, also those of an aborted parse
+        self.upload_files = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingFile(os.path.join(current_app.config['UPLOAD_FOLDER'], 'incoming'))
+        self.upload_files.append(stream)
+        return stream
+
+    def discard_uploads(self):
+        """Delete this request's temporary files that were not moved into the store"""
+        for stream in self.upload_files:
+            stream.close()
+        self.upload_files = []
+
+
+def render_thumbnails(source: str, targets: Dict[str, str]):
+    """Write one resized JPEG per size name (runs in a worker process)"""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size, target in targets.items():
+            width, height, crop = THUMBNAIL_SIZES[size]
+            if crop:
+                thumbnail = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            else:
+                thumbnail = image.copy()
+                thumbnail.thumbnail((width, height), Image.LANCZOS)
+            with atomic_path(target) as tmp_path:
+                thumbnail.save(tmp_path, 'JPEG', quality=82, optimize=True, progressive=True)
+
+
+class MediaStore:
+    """Content-addressed storage for recipe images and their thumbnails"""
+
+    def __init__(self, folder: str, max_workers: int = 2):
+        self.folder = folder
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Digests with thumbnails currently rendering
+        self._pending: Set[str] = set()
+        # Digests whose thumbnails failed to render, not retried until restart
+        self._failed: Set[str] = set()
+
+        self.sweep_incoming()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # Created lazily so forked server workers each get their own pool
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def sweep_incoming(self):
+        """Delete temporary uploads left behind by a crash or restart"""
+        incoming = os.path.join(self.folder, 'incoming')
+        if not os.path.isdir(incoming):
+            return
+        # Recent files may belong to an upload another worker is still receiving
+        cutoff = time.time() - STALE_UPLOAD_AGE
+        for entry in os.scandir(incoming):
+            if entry.name.endswith('.part') and entry.stat().st_mtime < cutoff:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _path(self, digest: str, ext: str, size: Optional[str] = None) -> str:
+        if size:
+            return os.path.join(self.folder, 'thumbs', digest[:2], f'{digest}-{size}.jpg')
+        return os.path.join(self.folder, 'originals', digest[:2], f'{digest}.{ext}')
+
+    def save_upload(self, file_storage) -> Optional[str]:
+        """Move an uploaded image into the store, returns its filename or None"""
+        stream = file_storage.stream
+        if not isinstance(stream, HashingFile):
+            # Uploads parsed outside UploadRequest, copy them over in chunks
+            stream = HashingFile(os.path.join(self.folder, 'incoming'))
+            file_storage.save(stream)
+            file_storage.stream = stream
+        stream.flush()
+
+        stream.seek(0)
+        header = stream.read(16)
+        ext = detect_image_type(header)
+        if ext is None:
+            return None
+        if not verify_image(stream.name, ext):
+            return None
+
+        digest = stream.sha256.hexdigest()
+        target = self._path(digest, ext)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(stream.name, target)
+
+        self.schedule_thumbnails(digest, ext)
+        return f'{digest}.{ext}'
+
+    def schedule_thumbnails(self, digest: str, ext: str):
+        """Render missing thumbnails in the process pool, off the request path"""
+        if digest in self._pending or digest in self._failed:
+            return
+        targets = {size: self._path(digest, ext, size) for size in THUMBNAIL_SIZES
+                   if not os.path.exists(self._path(digest, ext, size))}
+        if not targets:
+            return
+        for target in targets.values():
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+        self._pending.add(digest)
+        future = self.executor.submit(render_thumbnails, self._path(digest, ext), targets)
+        future.add_done_callback(lambda done: self._thumbnails_done(digest, done))
+
+    def _thumbnails_done(self, digest: str, future):
+        self._pending.discard(digest)
+        if future.exception() is not None:
+            self._failed.add(digest)
+            logger.error('Thumbnail rendering failed for %s: %s', digest, future.exception())
+
+    def url(self, image: str, size: Optional[str] = None) -> str:
+        """URL of an image, or of one of its thumbnails"""
+        if size:
+            digest, _ext = image.split('.', 1)
+            return url_for('media', filename=f'{digest}-{size}.jpg')
+        return url_for('media', filename=image)
+
+    def send(self, filename: str):
+        """Serve an image with range support and long-lived cache headers"""
+        match = MEDIA_FILENAME.match(filename)
+        if not match:
+            abort(404)
+
+        digest, size, ext = match.group('digest', 'size', 'ext')
+        if size and size not in THUMBNAIL_SIZES:
+            abort(404)
+        path = self._path(digest, ext, size)
+        immutable = True
+
+        if size and not os.path.exists(path):
+            # Thumbnail still rendering, serve the original without caching it
+            original_ext = next((candidate for candidate in IMAGE_EXTENSIONS
+                                 if os.path.exists(self._path(digest, candidate))), None)
+            if original_ext is None:
+                abort(404)
+            self.schedule_thumbnails(digest, original_ext)
+            path, size = self._path(digest, original_ext), None
+            immutable = False
+        elif not os.path.exists(path):
+            abort(404)
+
+        response = send_file(path, etag=f'{digest}-{size or "original"}', conditional=True)
+        if immutable:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
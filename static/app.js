@@ -42,6 +42,13 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Meal planning enhancements
     initializeMealPlanning();
+    
+    // Offline support for the shopping lists
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(function(error) {
+            console.warn('Service worker registration failed:', error);
+        });
+    }
 });
 
 // Shopping List Functions
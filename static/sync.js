@@ -0,0 +1,170 @@
+// Offline sync for shopping lists
+//
+// Changes are queued in a localStorage outbox and replayed against a sync
+// endpoint, which answers with everything changed since the last sequence
+// number the page has seen. Queued changes survive reloads, so a list that
+// was edited offline catches up as soon as the connection is back.
+
+function createShoppingSync(options) {
+    const outboxKey = `${options.storageKey}_outbox`;
+    let syncId = options.syncId;
+    let seq = options.seq;
+    let syncing = false;
+    let flushAgain = false;
+
+    // Identifies this browser, so the server applies its consecutive toggles in order
+    let clientId = localStorage.getItem('shoppingSync_clientId');
+    if (!clientId) {
+        clientId = generateId();
+        localStorage.setItem('shoppingSync_clientId', clientId);
+    }
+
+    function loadOutbox() {
+        const saved = localStorage.getItem(outboxKey);
+        return saved ? JSON.parse(saved) : [];
+    }
+
+    function saveOutbox(outbox) {
+        if (outbox.length) {
+            localStorage.setItem(outboxKey, JSON.stringify(outbox));
+        } else {
+            localStorage.removeItem(outboxKey);
+        }
+    }
+
+    // Badge telling whether changes are still waiting for the server
+    function updateStatus() {
+        const badge = options.statusElement;
+        if (!badge) {
+            return;
+        }
+        const pending = loadOutbox().length;
+        if (pending) {
+            badge.textContent = `${navigator.onLine ? 'Synchronisiere' : 'Offline'}: ${pending} Änderung(en) ausstehend`;
+            badge.style.display = '';
+        } else if (!navigator.onLine) {
+            badge.textContent = 'Offline';
+            badge.style.display = '';
+        } else {
+            badge.style.display = 'none';
+        }
+    }
+
+    // Queue a change and try to send it right away
+    function enqueue(op) {
+        const outbox = loadOutbox();
+        // Tabs share the outbox, the id tells which ops a sync actually sent
+        outbox.push(Object.assign({op_id: generateId()}, op));
+        saveOutbox(outbox);
+        updateStatus();
+        return flush();
+    }
+
+    // Only drop what was sent, changes queued meanwhile (by any tab) stay in the outbox
+    function removeSent(ops) {
+        const sent = new Set(ops.map(op => op.op_id));
+        saveOutbox(loadOutbox().filter(op => !sent.has(op.op_id)));
+    }
+
+    // Send queued changes and apply the delta returned by the server
+    async function flush() {
+        if (syncing) {
+            // Picked up once the running sync is done
+            flushAgain = true;
+            return;
+        }
+        syncing = true;
+        const ops = loadOutbox();
+
+        try {
+            const response = await fetch(options.url, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({client_id: clientId, sync_id: syncId, since: seq, ops: ops})
+            });
+            // Captive portals and proxies answer with HTML or their own errors, so only
+            // a JSON reply from the sync endpoint itself decides what happens to the ops
+            const result = await readResult(response);
+            if (result === null) {
+                throw new Error(`Sync failed with status ${response.status}`);
+            }
+
+            if (result.success) {
+                removeSent(ops);
+                // The server restarted or no longer remembers every removal since seq
+                const reset = result.reset === true || result.sync_id !== syncId;
+                syncId = result.sync_id;
+                seq = result.seq;
+                options.onDelta(result, reset);
+            } else {
+                // Refused for good (e.g. the meal plan was deleted), retrying cannot help
+                removeSent(ops);
+                console.warn(`Shopping list sync rejected with status ${response.status}, dropped ${ops.length} change(s)`);
+            }
+        } catch (error) {
+            // Offline, server unreachable or failing, keep the outbox for the next attempt
+            console.warn('Shopping list sync postponed:', error);
+        } finally {
+            syncing = false;
+            updateStatus();
+        }
+
+        if (flushAgain) {
+            flushAgain = false;
+            return flush();
+        }
+    }
+
+    window.addEventListener('online', flush);
+    window.addEventListener('offline', updateStatus);
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'visible') {
+            flush();
+        }
+    });
+
+    return {
+        enqueue: enqueue,
+        flush: flush,
+        pending: loadOutbox
+    };
+}
+
+// Sync endpoint reply: a delta, a rejection ({success: false} with 400/404) or null to retry
+async function readResult(response) {
+    if (response.redirected || !(response.headers.get('Content-Type') || '').includes('application/json')) {
+        return null;
+    }
+    let result;
+    try {
+        result = await response.json();
+    } catch (error) {
+        return null;
+    }
+    if (!result || typeof result !== 'object') {
+        return null;
+    }
+    if (response.ok && result.success === true && typeof result.sync_id === 'string') {
+        return result;
+    }
+    if ((response.status === 400 || response.status === 404) && result.success === false) {
+        return result;
+    }
+    return null;
+}
+
+// Client-side ids for items added offline, so replays are not duplicated
+function generateId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, function(c) {
+        const r = Math.random() * 16 | 0;
+        return (c === 'x' ? r : (r & 0x3 | 0x8)).toString(16);
+    });
+}
+
+window.ShoppingSync = {
+    create: createShoppingSync,
+    generateId: generateId
+};
@@ -0,0 +1,109 @@
+// Service worker for offline shopping
+// Rendered by Flask so the precache list always holds the current fingerprinted asset URLs.
+
+const ASSET_CACHE = 'meal-planner-assets';
+// Cached pages reference fingerprinted assets, so they are dropped whenever the asset set changes
+const PAGE_CACHE_PREFIX = 'meal-planner-pages';
+const PAGE_CACHE = `${PAGE_CACHE_PREFIX}-{{ cache_version }}`;
+
+const PRECACHE_ASSETS = [
+    {%- for url in precache_assets %}
+    '{{ url }}',
+    {%- endfor %}
+];
+
+const PRECACHE_PAGES = ['{{ url_for('general_shopping_list') }}'];
+
+// Pages that may be opened offline: the general list and every meal plan list
+const OFFLINE_PAGE = /^\/(shopping-list|meal-plans\/[^/]+\/shopping-list)$/;
+
+self.addEventListener('install', function(event) {
+    event.waitUntil(Promise.all([
+        caches.open(ASSET_CACHE).then(cache => cache.addAll(PRECACHE_ASSETS)),
+        caches.open(PAGE_CACHE).then(cache => cache.addAll(PRECACHE_PAGES)).catch(() => {})
+    ]).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', function(event) {
+    // Fingerprinted URLs never change, so only drop assets that are no longer referenced
+    const current = new Set(PRECACHE_ASSETS.map(url => new URL(url, self.location).href));
+    event.waitUntil(Promise.all([
+        caches.open(ASSET_CACHE)
+            .then(cache => cache.keys().then(requests => Promise.all(
+                requests.filter(request => !current.has(request.url)).map(request => cache.delete(request))
+            ))),
+        caches.keys().then(names => Promise.all(
+            names.filter(name => name.startsWith(PAGE_CACHE_PREFIX) && name !== PAGE_CACHE)
+                .map(name => caches.delete(name))
+        ))
+    ]).then(() => self.clients.claim()));
+});
+
+self.addEventListener('fetch', function(event) {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin) {
+        return;
+    }
+
+    if (url.pathname.startsWith('/assets/')) {
+        event.respondWith(cacheFirst(request));
+    } else if (request.mode === 'navigate' && OFFLINE_PAGE.test(url.pathname)) {
+        if (url.searchParams.has('refresh')) {
+            event.respondWith(networkFirst(request, url.pathname));
+        } else {
+            event.respondWith(staleWhileRevalidate(request, url.pathname, event));
+        }
+    }
+});
+
+// Immutable assets: the cached copy is always correct
+async function cacheFirst(request) {
+    const cache = await caches.open(ASSET_CACHE);
+    const cached = await cache.match(request);
+    if (cached) {
+        return cached;
+    }
+    const response = await fetch(request);
+    if (response.ok) {
+        cache.put(request, response.clone());
+    }
+    return response;
+}
+
+// Pages are cached by path, the query only tells the service worker how to fetch them
+function fetchPage(request, cache, key) {
+    return fetch(request).then(function(response) {
+        if (response.ok && !response.redirected) {
+            cache.put(key, response.clone());
+        }
+        return response;
+    });
+}
+
+// Shopping lists open instantly from cache, the page then fetches a delta via the sync endpoint
+async function staleWhileRevalidate(request, key, event) {
+    const cache = await caches.open(PAGE_CACHE);
+    const cached = await cache.match(key);
+    const network = fetchPage(request, cache, key);
+
+    if (cached) {
+        event.waitUntil(network.catch(() => {}));
+        return cached;
+    }
+    return network;
+}
+
+// Reload requested by a page whose meal plan changed, the cached copy is known to be outdated
+async function networkFirst(request, key) {
+    const cache = await caches.open(PAGE_CACHE);
+    try {
+        return await fetchPage(request, cache, key);
+    } catch (error) {
+        const cached = await cache.match(key);
+        if (cached) {
+            return cached;
+        }
+        throw error;
+    }
+}
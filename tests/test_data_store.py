@@ -0,0 +1,79 @@
+import uuid
+from datetime import date, timedelta
+
+from data_store import DataStore
+
+CLIENT_A = str(uuid.uuid4())
+CLIENT_B = str(uuid.uuid4())
+
+
+def add_shopping_item(store: DataStore) -> str:
+    item_id = next(iter(store.items))
+    return store.add_shopping_item(item_id, 1, 'Stück', client_id=CLIENT_A)
+
+
+def test_own_consecutive_toggles_apply_in_order():
+    store = DataStore()
+    shopping_item_id = add_shopping_item(store)
+    base_seq = store.shopping_list[shopping_item_id]['seq']
+
+    # Check then uncheck while offline, both ops carry the same base_seq
+    store.set_shopping_item_checked(shopping_item_id, True, base_seq, CLIENT_A)
+    store.set_shopping_item_checked(shopping_item_id, False, base_seq, CLIENT_A)
+
+    assert store.shopping_list[shopping_item_id]['checked'] is False
+
+
+def test_concurrent_toggle_of_other_client_keeps_checked():
+    store = DataStore()
+    shopping_item_id = add_shopping_item(store)
+    base_seq = store.shopping_list[shopping_item_id]['seq']
+
+    store.set_shopping_item_checked(shopping_item_id, True, base_seq, CLIENT_B)
+    store.set_shopping_item_checked(shopping_item_id, False, base_seq, CLIENT_A)
+
+    assert store.shopping_list[shopping_item_id]['checked'] is True
+
+
+def test_own_consecutive_plan_toggles_apply_in_order():
+    store = DataStore()
+    plan_id = store.add_meal_plan(date(2026, 10, 19))
+
+    store.set_plan_item_checked(plan_id, 'item_g', True, 0, CLIENT_A)
+    store.set_plan_item_checked(plan_id, 'item_g', False, 0, CLIENT_A)
+    assert store.meal_plans[plan_id]['checked_items']['item_g']['checked'] is False
+
+    store.set_plan_item_checked(plan_id, 'item_g', True, 0, CLIENT_B)
+    store.set_plan_item_checked(plan_id, 'item_g', False, 0, CLIENT_A)
+    assert store.meal_plans[plan_id]['checked_items']['item_g']['checked'] is True
+
+
+def test_resync_from_scratch_gets_no_tombstones():
+    store = DataStore()
+    kept = add_shopping_item(store)
+    store.remove_shopping_item(add_shopping_item(store))
+
+    changed, removed, reset = store.shopping_list_changes(0)
+
+    assert reset is True
+    assert [item['id'] for item in changed] == [kept]
+    assert removed == []
+
+
+def test_client_behind_pruned_tombstones_gets_reset(monkeypatch):
+    store = DataStore()
+    removed_id = add_shopping_item(store)
+    kept = add_shopping_item(store)
+    since = store.sequence
+    store.remove_shopping_item(removed_id)
+
+    changed, removed, reset = store.shopping_list_changes(since)
+    assert (changed, removed, reset) == ([], [removed_id], False)
+
+    monkeypatch.setattr('data_store.TOMBSTONE_RETENTION', timedelta(0))
+    changed, removed, reset = store.shopping_list_changes(since)
+
+    assert store.removed_shopping_items == {}
+    assert reset is True
+    assert [item['id'] for item in changed] == [kept]
+    assert removed == []
@@ -0,0 +1,86 @@
+import io
+import os
+from concurrent.futures import Future
+
+import pytest
+from flask import Flask
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from media import MediaStore
+
+
+class PendingExecutor:
+    """Executor whose jobs never finish, so thumbnails stay pending"""
+
+    def submit(self, fn, *args, **kwargs):
+        return Future()
+
+
+def image_bytes(format: str, size=(40, 30)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 100, 50)).save(buffer, format)
+    return buffer.getvalue()
+
+
+def upload(store: MediaStore, data: bytes):
+    return store.save_upload(FileStorage(stream=io.BytesIO(data), filename='upload'))
+
+
+@pytest.fixture
+def store(tmp_path):
+    media_store = MediaStore(str(tmp_path))
+    media_store._executor = PendingExecutor()
+    return media_store
+
+
+@pytest.fixture
+def client(store):
+    app = Flask(__name__)
+    app.add_url_rule('/media/<path:filename>', 'media', store.send)
+    return app.test_client()
+
+
+def test_same_image_is_stored_once(store):
+    data = image_bytes('PNG')
+
+    first = upload(store, data)
+    second = upload(store, data)
+
+    assert first == second
+    assert first.endswith('.png')
+    originals = [name for _root, _dirs, names in os.walk(os.path.join(store.folder, 'originals')) for name in names]
+    assert originals == [first]
+
+
+def test_non_image_is_rejected(store):
+    assert upload(store, b'<?php echo "hello"; ?>' * 10) is None
+
+
+def test_image_not_matching_its_header_is_rejected(store):
+    # PNG signature followed by JPEG data
+    data = b'\x89PNG\r\n\x1a\n' + image_bytes('JPEG')
+    assert upload(store, data) is None
+
+
+def test_original_supports_range_requests(store, client):
+    data = image_bytes('JPEG')
+    filename = upload(store, data)
+
+    response = client.get(f'/media/{filename}', headers={'Range': 'bytes=0-9'})
+
+    assert response.status_code == 206
+    assert response.data == data[:10]
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_pending_thumbnail_serves_original_uncached(store, client):
+    data = image_bytes('PNG')
+    filename = upload(store, data)
+    digest = filename.split('.')[0]
+
+    response = client.get(f'/media/{digest}-list.jpg')
+
+    assert response.status_code == 200
+    assert response.data == data
+    assert response.headers['Cache-Control'] == 'no-cache'
@@ -1,3 +1,5 @@
+import hashlib
+import json
 from typing import List, Dict
 from collections import defaultdict
 
@@ -60,6 +62,12 @@ def consolidate_shopping_items(shopping_items: List[Dict]) -> List[Dict]:
     
     return result
 
+def shopping_list_version(consolidated_items: List[Dict]) -> str:
+    """Content hash of a consolidated shopping list, changes whenever the plan's items do"""
+    content = [(item['item_id'], item['item_name'], item['quantity'], item['unit'],
+                item['category'], item['sources']) for item in consolidated_items]
+    return hashlib.sha256(json.dumps(content, default=str).encode()).hexdigest()[:12]
+
 def format_quantity(quantity: float, unit: str) -> str:
     """Format quantity for display"""
     if quantity == int(quantity):